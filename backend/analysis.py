@@ -0,0 +1,189 @@
+# backend/analysis.py
+# Schreib-Analyse pro Szene: Satzlängen, Füllwörter, Wiederholungen, Dialoganteil, Lesbarkeit.
+# Rohwerte ("stats") sind additiv -> pro Kapitel/Projekt einfach aufsummieren (merge_stats),
+# Kennzahlen werden erst am Ende abgeleitet (summarize).
+from __future__ import annotations
+
+import atexit, hashlib, multiprocessing, os, re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+ANALYZER_VERSION = 2
+
+_WORD_RE = re.compile(r"[^\W\d_]+(?:[-'’][^\W\d_]+)*")
+_SENT_SPLIT_RE = re.compile(r"(?<=[.!?…])[\"'“”»«]*\s+|\n\s*\n")
+_DIALOGUE_RE = re.compile(r"„[^“”\"]*[“”\"]|“[^”]*”|\"[^\"\n]*\"|»[^«]*«|«[^»]*»")
+_SYLLABLE_RE = re.compile(r"[aeiouyäöü]+", re.IGNORECASE)
+
+_STOPWORDS = frozenset("""
+aber alle allem allen aller alles als also am an ander andere anderen anderer anderes auch auf aus bei bin bis bist
+da damit dann das dass dein deine deinem deinen deiner dem den denn der des dich die dies diese diesem diesen dieser
+dieses dir doch dort du durch ein eine einem einen einer eines er es etwas euch euer eure für gegen gewesen hab habe
+haben hat hatte hatten hier hin hinter ich ihm ihn ihnen ihr ihre ihrem ihren ihrer im in indem ins ist jede jedem
+jeden jeder jedes jetzt kann kein keine keinem keinen können könnte man manche mein meine meinem meinen meiner mich
+mir mit muss musste nach nicht nichts noch nun nur ob oder ohne sehr sein seine seinem seinen seiner selbst sich sie
+sind so solche soll sollte sondern sonst über um und uns unser unsere unter vom von vor war waren warst was weil
+weiter welche wenn wer werde werden wie wieder will wir wird wo wollte würde würden zu zum zur zwar zwischen
+a an and are as at be but by for from had has have he her his i in is it its me my not of on or she so that the
+their them they this to was we were with you
+""".split())
+
+_PHRASE_N = 3
+_LONG_WORD = 7          # LIX: Wörter mit mehr als 6 Buchstaben
+_TOP_N = 20
+
+def content_hash(text: str) -> str:
+    """Cache-Schlüssel: Inhalt + Analyzer-Version (neue Version => alles neu berechnen)."""
+    h = hashlib.sha256(f"v{ANALYZER_VERSION}\0".encode("utf-8"))
+    h.update((text or "").encode("utf-8"))
+    return h.hexdigest()
+
+def _syllables(word: str) -> int:
+    return max(1, len(_SYLLABLE_RE.findall(word)))
+
+def analyze_text(text: str) -> dict:
+    """Additive Rohwerte für einen Text (eine Szene)."""
+    text = text or ""
+    sent_lengths: Counter = Counter()
+    words_total = syllables = long_words = 0
+    word_counts: Counter = Counter()
+    phrases: Counter = Counter()
+
+    for sent in _SENT_SPLIT_RE.split(text):
+        words = _WORD_RE.findall(sent)
+        if not words: continue
+        sent_lengths[len(words)] += 1
+        words_total += len(words)
+        lower = [w.lower() for w in words]
+        for w in lower:
+            syllables += _syllables(w)
+            if len(w) >= _LONG_WORD: long_words += 1
+            if len(w) > 2 and w not in _STOPWORDS: word_counts[w] += 1
+        for i in range(len(lower) - _PHRASE_N + 1):
+            gram = lower[i:i + _PHRASE_N]
+            if all(g in _STOPWORDS for g in gram): continue
+            phrases[" ".join(gram)] += 1
+
+    dialogue_chars = sum(len(m) for m in _DIALOGUE_RE.findall(text))
+    return {
+        "words": words_total,
+        "sentences": sum(sent_lengths.values()),
+        "syllables": syllables,
+        "long_words": long_words,
+        "chars": len(text.strip()),
+        "dialogue_chars": dialogue_chars,
+        "sentence_lengths": {str(k): v for k, v in sent_lengths.items()},
+        "word_counts": dict(word_counts),
+        # alle Trigramme behalten (reine Füllwort-Trigramme sind schon raus): eine Wendung,
+        # die in mehreren Szenen je einmal vorkommt, ist erst im Kapitel/Projekt eine Wiederholung
+        "phrases": dict(phrases),
+    }
+
+def _analyze_chunk(texts: list[str]) -> list[dict]:
+    return [analyze_text(t) for t in texts]
+
+# ----------------- Prozess-Pool -----------------
+_POOL_MIN_CHARS = int(os.getenv("ANALYSIS_POOL_MIN_CHARS", "200000"))
+_POOL_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(min(4, os.cpu_count() or 1))))
+_pool: ProcessPoolExecutor | None = None
+_pool_pid: int | None = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    # pro (Gunicorn-)Worker-Prozess ein eigener Pool, nie über fork() hinweg teilen
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        # kein fork: der Gunicorn-Worker hat bereits Threads (Autosave-Flush) -> Deadlock-Gefahr
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(max_workers=_POOL_WORKERS, mp_context=multiprocessing.get_context(method))
+        _pool_pid = os.getpid()
+    return _pool
+
+@atexit.register
+def _shutdown_pool():
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+def analyze_many(texts: list[str]) -> list[dict]:
+    """Analysiert viele Texte gebündelt; große Mengen laufen in Batches im Prozess-Pool."""
+    global _pool
+    texts = list(texts)
+    total = sum(len(t or "") for t in texts)
+    if _POOL_WORKERS <= 1 or len(texts) < 2 or total < _POOL_MIN_CHARS:
+        return _analyze_chunk(texts)
+    # ungefähr gleich große Batches (nach Zeichen), damit kein Worker allein das lange Kapitel rechnet
+    target = max(1, total // (_POOL_WORKERS * 4))
+    chunks, cur, size = [], [], 0
+    for t in texts:
+        cur.append(t); size += len(t or "")
+        if size >= target:
+            chunks.append(cur); cur, size = [], 0
+    if cur: chunks.append(cur)
+    try:
+        out = []
+        for part in _get_pool().map(_analyze_chunk, chunks):
+            out.extend(part)
+        return out
+    except BrokenProcessPool:
+        # Worker gekillt (OOM o. ä.) -> Pool abräumen, seriell weiter, beim nächsten Mal neu
+        broken, _pool = _pool, None
+        if broken is not None: broken.shutdown(wait=False, cancel_futures=True)
+        return _analyze_chunk(texts)
+
+# ----------------- Aggregation -----------------
+def merge_stats(items) -> dict:
+    out = {"words": 0, "sentences": 0, "syllables": 0, "long_words": 0, "chars": 0, "dialogue_chars": 0}
+    sent_lengths, word_counts, phrases = Counter(), Counter(), Counter()
+    for s in items:
+        for k in out: out[k] += s.get(k, 0)
+        sent_lengths.update(s.get("sentence_lengths", {}))
+        word_counts.update(s.get("word_counts", {}))
+        phrases.update(s.get("phrases", {}))
+    out["sentence_lengths"] = dict(sent_lengths)
+    out["word_counts"] = dict(word_counts)
+    out["phrases"] = dict(phrases)
+    return out
+
+_BUCKETS = [(1, 5), (6, 10), (11, 15), (16, 20), (21, 30), (31, 40), (41, None)]
+
+def _sentence_summary(lengths: dict) -> dict:
+    pairs = sorted((int(k), v) for k, v in lengths.items())
+    n = sum(v for _, v in pairs)
+    hist = []
+    for lo, hi in _BUCKETS:
+        cnt = sum(v for k, v in pairs if k >= lo and (hi is None or k <= hi))
+        hist.append({"range": f"{lo}-{hi}" if hi else f"{lo}+", "count": cnt})
+    if not n:
+        return {"mean": 0, "median": 0, "max": 0, "histogram": hist}
+    mean = sum(k * v for k, v in pairs) / n
+    half, seen, median = (n + 1) / 2, 0, 0
+    for k, v in pairs:
+        seen += v
+        if seen >= half: median = k; break
+    return {"mean": round(mean, 1), "median": median, "max": pairs[-1][0], "histogram": hist}
+
+def summarize(stats: dict) -> dict:
+    """Kennzahlen aus (ggf. aggregierten) Rohwerten."""
+    words, sents = stats.get("words", 0), stats.get("sentences", 0)
+    per_1000 = (1000 / words) if words else 0
+    overused = Counter(stats.get("word_counts", {})).most_common(_TOP_N)
+    repeated = Counter(stats.get("phrases", {})).most_common(_TOP_N)
+    if words and sents:
+        asl = words / sents
+        asw = stats.get("syllables", 0) / words
+        readability = {
+            "flesch_de": round(180 - asl - 58.5 * asw, 1),          # Amstad (deutsche Flesch-Variante)
+            "lix": round(asl + 100 * stats.get("long_words", 0) / words, 1),
+        }
+    else:
+        readability = {"flesch_de": None, "lix": None}
+    chars = stats.get("chars", 0)
+    return {
+        "word_count": words,
+        "sentence_count": sents,
+        "sentence_length": _sentence_summary(stats.get("sentence_lengths", {})),
+        "overused_words": [{"word": w, "count": c, "per_1000": round(c * per_1000, 2)} for w, c in overused],
+        "repeated_phrases": [{"phrase": p, "count": c} for p, c in repeated if c > 1],
+        "dialogue_ratio": round(stats.get("dialogue_chars", 0) / chars, 3) if chars else 0,
+        "readability": readability,
+    }
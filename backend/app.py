@@ -2,12 +2,15 @@ from flask import Flask, request, jsonify, abort, Response
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import selectinload
-from sqlalchemy import text
+from sqlalchemy import text, insert, select, update, literal, bindparam
 from sqlalchemy.exc import SQLAlchemyError
 from .db import engine, get_session, Base
 from .models import Project, Chapter, Scene, Character, WorldNode
+from .analysis import analyze_many, content_hash, merge_stats, summarize
+from .render import book_etag, build_epub, build_preview
+from .write_buffer import WriteBuffer
 from datetime import datetime
-import os, json, tempfile
+import os, json, tempfile, atexit
 
 # Optional: PyVis
 try:
@@ -131,6 +134,48 @@ class WorldItem(db.Model):
                 "props": _parse_props(self.props),
                 "relations": _parse_relations(self.relations)}
 
+# Analyse-Cache: eine Zeile pro Szene, gültig solange der Inhalts-Hash passt (siehe analysis.content_hash)
+class SceneAnalysis(db.Model):
+    __tablename__ = "scene_analyses"
+    scene_id = db.Column(db.Integer, primary_key=True)        # bewusst ohne FK, Aufräumen per _prune_analyses
+    content_hash = db.Column(db.String(64), nullable=False)
+    stats = db.Column(db.Text, nullable=False, default="{}")   # additive Rohwerte (JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# ----------------- Autosave-Puffer -----------------
+# Szenen-/Kapitel-PUTs gehen ins Journal statt direkt in die DB (AUTOSAVE_FLUSH_SECONDS=0 schaltet ab)
+# Das Journal ist eine lokale Datei: nur sicher, wenn alle API-Prozesse auf EINEM Host laufen.
+# Mit DATABASE_URL (geteilte DB, ggf. mehrere Instanzen) daher standardmäßig aus.
+_flush_seconds = float(os.getenv("AUTOSAVE_FLUSH_SECONDS", "0" if os.getenv("DATABASE_URL") else "5"))
+_journal_path = os.getenv("AUTOSAVE_JOURNAL") or (
+    "/tmp/autosave.journal" if os.getenv("AWS_EXECUTION_ENV")
+    else os.path.join(os.path.dirname(__file__), "autosave.journal"))
+write_buffer = WriteBuffer(
+    _journal_path,
+    {"scenes": (Scene.__table__, {"title", "order_index", "content"}),
+     "chapters": (Chapter.__table__, {"title", "order_index", "content"})},
+    flush_interval=_flush_seconds,
+    fsync=os.getenv("AUTOSAVE_FSYNC", "1") != "0",
+) if _flush_seconds > 0 else None
+
+_BUFFERED_ENDPOINTS = {"scene_detail", "chapter_detail"}
+
+def _buffered_save(table, row, data):
+    try:
+        pending = write_buffer.save(table, row.id, data)
+    except ValueError as e:
+        abort(400, str(e))
+    out = row.to_dict()   # DB-Stand + noch nicht geflushte Felder (aller Worker)
+    out.update(pending)
+    return out
+
+@app.before_request
+def _flush_before_read():
+    # alles außer gepufferten PUTs sieht den aktuellen Stand (auch Löschen/Umsortieren danach)
+    if not write_buffer: return
+    if request.method == "PUT" and request.endpoint in _BUFFERED_ENDPOINTS: return
+    write_buffer.try_flush()   # Fehler nur loggen, Request läuft trotzdem
+
 # ----------------- Helpers -----------------
 def get_or_404(model, id_):
     item = db.session.get(model, id_)
@@ -346,6 +391,75 @@ def project_detail(pid):
 
 
 
+# Projekt duplizieren (Alternativ-Fassung): alles per INSERT … SELECT in einer Transaktion.
+# Neue ids werden vorab als Block reserviert und explizit vergeben (new_id = base + Rang der alten id),
+# die old->new-Zuordnung hängt also nicht davon ab, in welcher Reihenfolge die DB ids verteilt.
+def _lock_ids(tbl):
+    if db.engine.dialect.name == "postgresql":
+        # blockiert parallele INSERTs in tbl bis zum Commit, damit der reservierte Block frei bleibt
+        db.session.execute(text(f"LOCK TABLE {tbl.name} IN SHARE ROW EXCLUSIVE MODE"))
+    # SQLite: Schreibtransaktion läuft seit dem Projekt-INSERT, keine parallelen Schreiber
+
+def _reserve_ids(tbl, n):
+    """Gibt base zurück; base+1 … base+n sind frei (Tabelle ist per _lock_ids gesperrt)."""
+    base = db.session.execute(select(func.coalesce(func.max(tbl.c.id), 0))).scalar()
+    if db.engine.dialect.name == "postgresql":
+        seq = db.session.execute(text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": tbl.name}).scalar()
+        base = max(base, db.session.execute(text(f"SELECT last_value FROM {seq}")).scalar())
+        db.session.execute(text("SELECT setval(:s, :v)"), {"s": seq, "v": base + n})
+    return base
+
+def _copy_rows(tbl, parent_col, parent_map):
+    """Kopiert alle Zeilen von tbl, deren parent_col in parent_map.old_id liegt, unter parent new_id.
+    Liefert die old_id -> new_id-Zuordnung der Kopien als Subquery."""
+    _lock_ids(tbl)
+    joined = lambda q: q.join_from(tbl, parent_map, tbl.c[parent_col] == parent_map.c.old_id)
+    n = db.session.execute(joined(select(func.count()))).scalar()
+    base = _reserve_ids(tbl, n) if n else 0
+    id_map = joined(select(
+        tbl.c.id.label("old_id"),
+        (literal(base) + func.row_number().over(order_by=tbl.c.id)).label("new_id"),
+        parent_map.c.new_id.label("parent_new_id"),
+    )).subquery()
+    if not n: return id_map
+    cols = [c for c in tbl.c if c.name not in ("id", parent_col)]
+    sel = select(id_map.c.new_id, id_map.c.parent_new_id, *cols).join_from(tbl, id_map, tbl.c.id == id_map.c.old_id)
+    res = db.session.execute(insert(tbl).from_select(["id", parent_col, *[c.name for c in cols]], sel))
+    if res.rowcount != n:
+        raise RuntimeError(f"duplicate: {tbl.name} {res.rowcount} statt {n} Zeilen kopiert")
+    return id_map
+
+def _remap_relations(tbl, id_map):
+    idmap = dict(db.session.execute(select(id_map.c.old_id, id_map.c.new_id)).all())
+    if not idmap: return
+    rows = db.session.execute(select(tbl.c.id, tbl.c.relations).where(tbl.c.id.in_(select(id_map.c.new_id)))).all()
+    params = []
+    for rid, rel in rows:
+        new_rel = [{**r, "toId": idmap[r["toId"]]} for r in _parse_relations(rel) if r["toId"] in idmap]
+        params.append({"rid": rid, "rel": json.dumps(new_rel, ensure_ascii=False)})
+    if params:
+        db.session.execute(update(tbl).where(tbl.c.id == bindparam("rid")).values(relations=bindparam("rel")), params)
+
+@app.route("/api/projects/<int:pid>/duplicate", methods=["POST"])
+def project_duplicate(pid):
+    # nur Spalten laden – Project lädt Kapitel/Szenen sonst per selectin komplett mit
+    src = db.session.execute(select(Project.title, Project.description).where(Project.id == pid)).first()
+    if not src: abort(404, f"Project {pid} not found")
+    data = request.get_json(silent=True) or {}
+    dst = Project(title=data.get("title") or f"{src.title} (Kopie)", description=src.description)
+    db.session.add(dst); db.session.flush()
+
+    proj_map = select(literal(pid).label("old_id"), literal(dst.id).label("new_id")).subquery()
+    maps = {m: _copy_rows(m.__table__, "project_id", proj_map) for m in (Chapter, Character, WorldItem, Location)}
+    _copy_rows(Scene.__table__, "chapter_id", maps[Chapter])
+
+    for model in (Character, WorldItem):
+        _remap_relations(model.__table__, maps[model])
+
+    out = dst.to_dict()   # vor commit: danach würde das Refresh alle Kinder per selectin nachladen
+    db.session.commit()
+    return jsonify(out), 201
+
 # Chapters / Scenes (unchanged)
 @app.route("/api/projects/<int:pid>/chapters", methods=["GET","POST"])
 def project_chapters(pid):
@@ -364,6 +478,8 @@ def chapter_detail(cid):
     if request.method == "GET": return jsonify(c.to_dict())
     if request.method == "PUT":
         data = request.get_json() or {}
+        if write_buffer:
+            return jsonify(_buffered_save("chapters", c, data))
         c.title = data.get("title", c.title)
         c.order_index = data.get("order_index", c.order_index)
         c.content = data.get("content", c.content)
@@ -387,6 +503,8 @@ def scene_detail(sid):
     if request.method == "GET": return jsonify(sc.to_dict())
     if request.method == "PUT":
         data = request.get_json() or {}
+        if write_buffer:
+            return jsonify(_buffered_save("scenes", sc, data))
         sc.title = data.get("title", sc.title)
         sc.order_index = data.get("order_index", sc.order_index)
         sc.content = data.get("content", sc.content)
@@ -563,9 +681,7 @@ def project_world_graph(pid):
     return Response(html.replace("</head>", f"{inject}</head>"), mimetype="text/html")
 
 # Book export
-@app.route("/api/projects/<int:pid>/book", methods=["GET"])
-def project_book(pid):
-    p = get_or_404(Project, pid)
+def _book_chapters(pid):
     chapters = (Chapter.query.options(selectinload(Chapter.scenes))
                 .filter_by(project_id=pid)
                 .order_by(Chapter.order_index.asc(), Chapter.id.asc()).all())
@@ -574,8 +690,124 @@ def project_book(pid):
         "scenes": [{"id": s.id, "title": s.title, "order_index": s.order_index, "content": s.content or ""} 
                    for s in sorted(c.scenes, key=lambda s: (s.order_index, s.id))]
     } for c in chapters]
+    stamps = [x.updated_at for c in chapters for x in (c, *c.scenes) if x.updated_at]
+    return data, (max(stamps) if stamps else None)
+
+@app.route("/api/projects/<int:pid>/book", methods=["GET"])
+def project_book(pid):
+    p = get_or_404(Project, pid)
+    data, _ = _book_chapters(pid)
     return jsonify({"project": p.to_dict(), "chapters": data})
 
+def _conditional(resp, etag):
+    # Vorschau/Export immer revalidieren lassen; unverändert -> 304 ohne Body.
+    # Bewusst kein Last-Modified: Löschen/Umbenennen verschiebt kein updated_at, der ETag schon.
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+@app.route("/api/projects/<int:pid>/preview", methods=["GET"])
+def project_preview(pid):
+    # Serverseitig gerendertes Buch (Paged.js paginiert im Browser); nur geänderte Kapitel werden neu gerendert.
+    # Optional ?page=&per_page= (Kapitel pro Seite) für sehr lange Bücher.
+    p = get_or_404(Project, pid)
+    chapters, _ = _book_chapters(pid)
+    page = request.args.get("page", type=int)
+    per_page = request.args.get("per_page", default=10, type=int)
+    first_no = 1
+    if page is not None:
+        if page < 1 or per_page < 1: abort(400, "page/per_page müssen >= 1 sein")
+        first_no = (page - 1) * per_page + 1
+        chapters = chapters[first_no - 1:first_no - 1 + per_page]
+    etag = book_etag(f"{p.title}|{page}|{per_page if page is not None else ''}", chapters)
+    if request.if_none_match.contains(etag):
+        return _conditional(Response(status=304), etag)
+    html = build_preview(p.title, chapters, first_no=first_no, with_title_page=first_no == 1)
+    return _conditional(Response(html, mimetype="text/html"), etag)
+
+@app.route("/api/projects/<int:pid>/export.epub", methods=["GET"])
+def project_export_epub(pid):
+    p = get_or_404(Project, pid)
+    chapters, modified = _book_chapters(pid)
+    etag = book_etag(f"epub|{p.title}", chapters)
+    if request.if_none_match.contains(etag):
+        return _conditional(Response(status=304), etag)
+    resp = Response(build_epub(p.id, p.title, chapters, modified), mimetype="application/epub+zip")
+    resp.headers["Content-Disposition"] = f'attachment; filename="project-{p.id}.epub"'
+    return _conditional(resp, etag)
+
+# Schreib-Analyse (nur geänderte Szenen werden neu berechnet)
+_IN_CHUNK = 500   # SQLite-Limit für Bind-Parameter
+
+def _cached_analyses(scene_ids):
+    out, scene_ids = {}, list(scene_ids)
+    for i in range(0, len(scene_ids), _IN_CHUNK):
+        rows = SceneAnalysis.query.filter(SceneAnalysis.scene_id.in_(scene_ids[i:i + _IN_CHUNK])).all()
+        out.update({r.scene_id: (r.content_hash, r.stats) for r in rows})
+    return out
+
+def _upsert_analyses(rows):
+    # parallele Worker schreiben dieselbe Szene -> letzte gewinnt, kein Rollback des ganzen Batches
+    tbl = SceneAnalysis.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite": from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else: from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(tbl)
+        stmt = stmt.on_conflict_do_update(index_elements=[tbl.c.scene_id], set_={
+            "content_hash": stmt.excluded.content_hash, "stats": stmt.excluded.stats,
+            "created_at": stmt.excluded.created_at})
+        db.session.execute(stmt, rows)
+    else:
+        for r in rows: db.session.merge(SceneAnalysis(**r))
+
+def _prune_analyses():
+    # Einträge gelöschter Szenen entfernen (geänderte Szenen werden oben überschrieben)
+    SceneAnalysis.query.filter(~SceneAnalysis.scene_id.in_(select(Scene.id))).delete(synchronize_session=False)
+
+def _scene_stats(scenes):
+    """{scene_id: stats}; Szenen mit geändertem Inhalt gebündelt analysieren und cachen."""
+    hashes = {s.id: content_hash(s.content or "") for s in scenes}
+    cached = _cached_analyses(hashes)
+    stats, missing = {}, {}
+    for s in scenes:
+        h = hashes[s.id]
+        if s.id in cached and cached[s.id][0] == h:
+            stats[s.id] = json.loads(cached[s.id][1])
+        else:
+            missing.setdefault(h, []).append(s)
+    if missing:
+        keys = list(missing)
+        rows, now = [], datetime.utcnow()
+        for h, st in zip(keys, analyze_many([missing[k][0].content or "" for k in keys])):
+            raw = json.dumps(st, ensure_ascii=False)
+            for s in missing[h]:
+                stats[s.id] = st
+                rows.append({"scene_id": s.id, "content_hash": h, "stats": raw, "created_at": now})
+        _upsert_analyses(rows)
+        _prune_analyses()
+        db.session.commit()
+    return stats
+
+@app.route("/api/projects/<int:pid>/analysis", methods=["GET"])
+def project_analysis(pid):
+    p = get_or_404(Project, pid)
+    chapters = (Chapter.query.options(selectinload(Chapter.scenes))
+                .filter_by(project_id=pid)
+                .order_by(Chapter.order_index.asc(), Chapter.id.asc()).all())
+    stats = _scene_stats([s for c in chapters for s in c.scenes])
+    out, project_parts = [], []
+    for c in chapters:
+        scenes = sorted(c.scenes, key=lambda s: (s.order_index or 0, s.id))
+        ch_stats = merge_stats(stats[s.id] for s in scenes)
+        project_parts.append(ch_stats)
+        out.append({
+            "id": c.id, "title": c.title, "order_index": c.order_index,
+            "analysis": summarize(ch_stats),
+            "scenes": [{"id": s.id, "title": s.title, "analysis": summarize(stats[s.id])} for s in scenes],
+        })
+    return jsonify({"project": p.to_dict(), "analysis": summarize(merge_stats(project_parts)), "chapters": out})
+
 def ensure_project_columns():
     ensure_column("projects", "description", "TEXT DEFAULT ''")
     ensure_column("projects", "updated_at", "DATETIME")
@@ -599,6 +831,9 @@ with app.app_context():
     ensure_scene_columns()
     ensure_relations_column()
     ensure_profile_column()
+    if write_buffer:
+        write_buffer.start(db.engine)   # spielt Journal-Reste nach Absturz ein
+        atexit.register(write_buffer.try_flush)
 
 
 @app.get("/healthz")
@@ -0,0 +1,217 @@
+# backend/render.py
+# Serverseitiges Buch-Rendering: Kapitel -> HTML-Fragmente (Vorschau) bzw. XHTML-Dateien (EPUB).
+# Fragmente werden pro Kapitel/Szene + Inhalts-Hash gecacht, d. h. nach einer Änderung wird nur
+# das betroffene Kapitel neu gerendert; der Rest ist reines Zusammensetzen von Strings.
+from __future__ import annotations
+
+import hashlib, io, os, re, threading, uuid, zipfile
+from collections import OrderedDict
+from datetime import datetime, timezone
+from html import escape as _html_escape
+
+# ----------------- Fragment-Cache (LRU, pro Prozess, nach Größe begrenzt) -----------------
+_CACHE_MAX_CHARS = int(os.getenv("RENDER_CACHE_MB", "32")) * 1024 * 1024
+_cache: OrderedDict = OrderedDict()
+_cache_chars = 0
+_lock = threading.Lock()
+
+def _cached(key, build):
+    global _cache_chars
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    val = build()
+    if len(val) > _CACHE_MAX_CHARS: return val
+    with _lock:
+        if key not in _cache:
+            _cache[key] = val
+            _cache_chars += len(val)
+        while _cache_chars > _CACHE_MAX_CHARS:
+            _, old = _cache.popitem(last=False)
+            _cache_chars -= len(old)
+    return val
+
+def _digest(*parts) -> str:
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(str(p).encode("utf-8")); h.update(b"\0")
+    return h.hexdigest()
+
+def chapter_fingerprint(ch: dict) -> str:
+    """Hash über Kapiteltitel, Szenen-Reihenfolge und Szenen-Inhalte."""
+    return _digest(ch.get("title") or "", *(f"{s['id']}:{_digest(s.get('content') or '')}" for s in ch.get("scenes", [])))
+
+def book_etag(title: str, chapters: list[dict]) -> str:
+    return _digest(title or "", *(f"{c['id']}:{chapter_fingerprint(c)}" for c in chapters))
+
+# ----------------- Fragmente -----------------
+_PARA_SPLIT_RE = re.compile(r"\n\s*\n")
+_NEWLINES_RE = re.compile(r"\n+")
+
+# in XML verbotene Steuerzeichen (Form Feed, Vertical Tab … aus Word/PDF) -> Leerzeichen,
+# damit Vorschau und EPUB-XHTML identisch und wohlgeformt bleiben
+_XML_ILLEGAL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+def escape(text: str, quote: bool = True) -> str:
+    return _html_escape(_XML_ILLEGAL_RE.sub(" ", text), quote=quote)
+
+def paragraphs_html(text: str, first_is_dropcap: bool = False) -> str:
+    """Plaintext -> <p>…</p> (wie Preview.jsx); Ausgabe ist zugleich gültiges XHTML."""
+    parts = [p.strip() for p in _PARA_SPLIT_RE.split(text or "") if p.strip()]
+    out = []
+    for i, p in enumerate(parts):
+        cls = ' class="dropcap"' if first_is_dropcap and i == 0 else ""
+        out.append(f"<p{cls}>{_NEWLINES_RE.sub(' ', escape(p, quote=False))}</p>")
+    return "\n".join(out)
+
+def chapter_heading(no: int, title: str = "") -> str:
+    # Dopplung „Kapitel …“ vermeiden
+    t = (title or "").strip()
+    if re.match(r"^kapitel\b", t, re.IGNORECASE): return escape(t, quote=False)
+    return f"Kapitel {no}" + (f" — {escape(t, quote=False)}" if t else "")
+
+def _scene_html(sc: dict, dropcap: bool) -> str:
+    content = sc.get("content") or ""
+    return _cached(("scene", sc["id"], _digest(content), dropcap), lambda: paragraphs_html(content, dropcap))
+
+def render_chapter_html(no: int, ch: dict) -> str:
+    def build():
+        # keine Szenen-Titel in der Vorschau – nur Inhalte
+        scenes = "\n".join(_scene_html(sc, i == 0) for i, sc in enumerate(ch.get("scenes", [])))
+        return (f'<section id="ch-{ch["id"]}">\n<h1 class="chapter-title">{chapter_heading(no, ch.get("title"))}</h1>\n'
+                f"{scenes}\n</section>")
+    return _cached(("chapter", ch["id"], no, chapter_fingerprint(ch)), build)
+
+def render_chapter_xhtml(no: int, ch: dict, lang: str = "de") -> str:
+    # nicht extra gecacht: nur Hülle um das gecachte Kapitel-Fragment
+    return (f'<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+            f'<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="{lang}" xml:lang="{lang}">\n'
+            f'<head><meta charset="utf-8"/><title>{chapter_heading(no, ch.get("title"))}</title>'
+            f'<link rel="stylesheet" type="text/css" href="style.css"/></head>\n'
+            f'<body class="book">\n{render_chapter_html(no, ch)}\n</body>\n</html>\n')
+
+# ----------------- Vorschau (Paged.js) -----------------
+_BOOK_CSS = """
+  :root{--book-font:"EB Garamond","Georgia",serif;--font-size:11pt;--lh:1.42;--zoom:1}
+  html,body{margin:0;padding:0;background:#fff;overflow-x:hidden}
+  .book{font-family:var(--book-font);font-size:var(--font-size);line-height:var(--lh);color:#111}
+  @page{size:152.4mm 228.6mm;margin:20mm 18mm 24mm 18mm}
+  @page{
+    @top-center{content: string(running-chapter); font-family: var(--book-font); font-size:10pt; color:#444}
+    @bottom-center{content: counter(page); font-family: var(--book-font); font-size:10pt; color:#444}
+  }
+  h1.chapter-title{break-before: page;font-weight:600;font-size:18pt;text-align:center;margin:0 0 10mm;string-set: running-chapter content(text)}
+  .book p{text-align:justify;margin:0 0 3.2mm;text-indent:1.2em;widows:2;orphans:2}
+  .book h1 + p{ text-indent:0 }
+  .dropcap:first-letter{ float:left;font-size:3.2em;line-height:0.8;padding-right:.1em }
+"""
+
+_EPUB_CSS = """
+body.book{font-family:"EB Garamond",Georgia,serif;line-height:1.42}
+h1.chapter-title{page-break-before:always;font-weight:600;font-size:1.6em;text-align:center;margin:0 0 1.5em}
+p{text-align:justify;margin:0;text-indent:1.2em;widows:2;orphans:2}
+h1 + p{text-indent:0}
+.dropcap:first-letter{float:left;font-size:3.2em;line-height:0.8;padding-right:.1em}
+"""
+
+_SCREEN_CSS = """
+  .pagedjs_pages{transform: scale(var(--zoom));transform-origin: top center}
+  .pagedjs_page{box-shadow:0 10px 28px rgba(0,0,0,.10);margin: calc(16px / var(--zoom)) auto;border-radius:6px}
+  .pagedjs_area, .pagedjs_pages { background: transparent !important; }
+"""
+
+_PAGED_JS = """
+<script>
+  window.PagedConfig = { auto: true };
+  function fitToWidth(){
+    const first = document.querySelector('.pagedjs_page');
+    if(!first) return;
+    const viewport = window.innerWidth - 32;
+    const pageWidth = first.getBoundingClientRect().width;
+    if(!pageWidth) return;
+    const desired = Math.min(1.8, Math.max(1.0, viewport / pageWidth));
+    document.documentElement.style.setProperty('--zoom', desired.toFixed(2));
+  }
+  window.addEventListener('pagedjs:rendered', fitToWidth);
+  window.addEventListener('resize', fitToWidth);
+</script>
+<script src="https://unpkg.com/pagedjs@0.4.3/dist/paged.polyfill.js"></script>
+"""
+
+def build_preview(title: str, chapters: list[dict], first_no: int = 1, with_title_page: bool = True) -> str:
+    """Komplettes HTML-Dokument; Seitenumbruch übernimmt Paged.js im Browser."""
+    body = "\n".join(render_chapter_html(first_no + i, ch) for i, ch in enumerate(chapters))
+    title_page = ""
+    if with_title_page:
+        title_page = (f'<section style="break-before:page;text-align:center;margin-top:35mm">'
+                      f'<h1 style="font-size:28pt;margin:0 0 3mm">{escape(title or "Buch", quote=False)}</h1>'
+                      f'<div style="font-family:\'Crimson Pro\',Georgia,serif;font-size:12pt;color:#555">Roman – Vorschau</div>'
+                      f'</section>\n')
+    return (f'<!doctype html>\n<html lang="de">\n<head>\n<meta charset="utf-8">\n'
+            f'<meta name="viewport" content="width=device-width,initial-scale=1" />\n'
+            f'<title>{escape(title or "Buch", quote=False)}</title>\n'
+            f'<link href="https://fonts.googleapis.com/css2?family=EB+Garamond:wght@400;500;700&family=Crimson+Pro:wght@400;600&display=swap" rel="stylesheet">\n'
+            f'<style>{_BOOK_CSS}{_SCREEN_CSS}</style>\n{_PAGED_JS}</head>\n'
+            f'<body>\n<div class="book">\n{title_page}{body}\n</div>\n</body>\n</html>\n')
+
+# ----------------- EPUB 3 -----------------
+_CONTAINER_XML = """<?xml version="1.0" encoding="utf-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>
+"""
+
+def build_epub(project_id: int, title: str, chapters: list[dict], modified: datetime | None = None, lang: str = "de") -> bytes:
+    """Packt die (gecachten) Kapitel-XHTML-Dateien in ein EPUB-3-Archiv."""
+    title_x = escape(title or "Buch")
+    book_id = uuid.uuid5(uuid.NAMESPACE_URL, f"roman-writing-mvp:project:{project_id}")
+    stamp = (modified or datetime.now(timezone.utc)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    files = [(f"ch{i:03d}.xhtml", i, ch) for i, ch in enumerate(chapters, start=1)]
+
+    manifest = "\n".join(f'    <item id="ch{i:03d}" href="{fn}" media-type="application/xhtml+xml"/>' for fn, i, _ in files)
+    spine = "\n".join(f'    <itemref idref="ch{i:03d}"/>' for _, i, _ in files)
+    opf = f"""<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="bookid" xml:lang="{lang}">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="bookid">urn:uuid:{book_id}</dc:identifier>
+    <dc:title>{title_x}</dc:title>
+    <dc:language>{lang}</dc:language>
+    <meta property="dcterms:modified">{stamp}</meta>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+    <item id="css" href="style.css" media-type="text/css"/>
+{manifest}
+  </manifest>
+  <spine>
+    <itemref idref="nav" linear="no"/>
+{spine}
+  </spine>
+</package>
+"""
+    toc = "\n".join(f'      <li><a href="{fn}">{chapter_heading(i, ch.get("title"))}</a></li>' for fn, i, ch in files)
+    nav = f"""<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="{lang}" xml:lang="{lang}">
+<head><meta charset="utf-8"/><title>{title_x}</title></head>
+<body>
+  <nav epub:type="toc" id="toc"><h1>Inhalt</h1>
+    <ol>
+{toc}
+    </ol>
+  </nav>
+</body>
+</html>
+"""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        # "mimetype" muss der erste Eintrag sein und unkomprimiert
+        z.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        z.writestr("META-INF/container.xml", _CONTAINER_XML)
+        z.writestr("OEBPS/content.opf", opf)
+        z.writestr("OEBPS/nav.xhtml", nav)
+        z.writestr("OEBPS/style.css", _EPUB_CSS)
+        for fn, i, ch in files:
+            z.writestr(f"OEBPS/{fn}", render_chapter_xhtml(i, ch, lang))
+    return buf.getvalue()
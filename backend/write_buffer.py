@@ -0,0 +1,158 @@
+# backend/write_buffer.py
+# Autosave-Puffer: Szenen-/Kapitel-Speicherungen landen zuerst in einem Append-only-Journal
+# (eine JSON-Zeile + fsync), mehrfaches Speichern derselben Zeile wird zusammengefasst und nur die
+# letzte Version periodisch, beim Beenden oder vor Lesezugriffen in die Tabellen geschrieben.
+# Das Journal ist prozessübergreifend (Gunicorn-Worker) per flock geschützt; nach einem Absturz
+# wird es beim Start einfach erneut eingespielt. Achtung: lokale Datei -> nur für EINEN Host.
+from __future__ import annotations
+
+import json, logging, os, threading, time
+from datetime import datetime
+
+from sqlalchemy import Integer, String, Text, bindparam
+from sqlalchemy.exc import OperationalError, StatementError
+
+try:
+    import fcntl
+except ImportError:   # Windows: nur ein Prozess (Dev-Server) -> Thread-Lock reicht
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+class WriteBuffer:
+    def __init__(self, path: str, tables: dict, flush_interval: float = 5.0, fsync: bool = True):
+        # tables: {"scenes": (Table, {"title", "content", ...}), ...} – nur diese Spalten sind puffbar
+        self.path = path
+        self.dead_letter_path = path + ".rejected"
+        self.tables = tables
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.engine = None
+        self._lock = threading.RLock()
+        self._thread = None
+
+    # ----------------- Journal -----------------
+    def _open(self, mode):
+        f = open(self.path, mode)   # binär: letztes Byte prüfen, Zeilen als UTF-8-Bytes
+        if fcntl: fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _clean(self, table: str, fields: dict) -> dict:
+        """Nur puffbare Spalten, Typen wie in der DB; sonst ValueError (-> 400), bevor quittiert wird."""
+        tbl, allowed = self.tables[table]
+        out = {}
+        for k, v in fields.items():
+            if k not in allowed: continue
+            col = tbl.c[k]
+            if v is None:
+                if not col.nullable: raise ValueError(f"{k} darf nicht null sein")
+            elif isinstance(col.type, Integer):
+                if isinstance(v, bool): raise ValueError(f"{k} muss eine Zahl sein")
+                try: v = int(v)
+                except (TypeError, ValueError): raise ValueError(f"{k} muss eine Zahl sein")
+            elif isinstance(col.type, (String, Text)):
+                if not isinstance(v, str): raise ValueError(f"{k} muss Text sein")
+            out[k] = v
+        return out
+
+    def save(self, table: str, row_id: int, fields: dict) -> dict:
+        """Speicherung dauerhaft ins Journal schreiben; liefert alle offenen Felder dieser Zeile."""
+        fields = self._clean(table, fields)
+        fields["updated_at"] = datetime.utcnow().isoformat()
+        rec = {"t": table, "id": row_id, "f": fields}
+        line = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock, self._open("ab+") as f:
+            # abgeschnittene letzte Zeile (Absturz/Platte voll) abschließen, sonst klebt unser Satz daran
+            end = f.seek(0, os.SEEK_END)
+            if end:
+                f.seek(end - 1)
+                if f.read(1) != b"\n": line = b"\n" + line
+            f.write(line)
+            f.flush()
+            if self.fsync: os.fsync(f.fileno())
+            # erst quittieren, wenn der eigene Satz wieder lesbar ist
+            f.seek(0)
+            lines = f.read().splitlines()
+            try: ok = bool(lines) and json.loads(lines[-1]) == rec
+            except ValueError: ok = False
+            if not ok: raise OSError(f"Autosave-Journal {self.path}: Satz nicht lesbar zurückgeschrieben")
+            # Antwort aus dem Journal selbst (inkl. Speicherungen anderer Worker) -> genau das, was geflusht wird
+            return self._read(lines).get((table, row_id), {})
+
+    def _read(self, lines) -> dict[tuple[str, int], dict]:
+        merged: dict[tuple[str, int], dict] = {}
+        for raw in lines:
+            try: rec = json.loads(raw)
+            except ValueError: continue   # abgeschnittene letzte Zeile nach Absturz
+            if rec.get("t") in self.tables:
+                merged.setdefault((rec["t"], rec["id"]), {}).update(rec.get("f") or {})
+        return merged
+
+    def has_pending(self) -> bool:
+        try: return os.path.getsize(self.path) > 0
+        except OSError: return False
+
+    # ----------------- Flush -----------------
+    def flush(self) -> int:
+        """Journal zusammenführen und in einer Transaktion schreiben. Gibt Anzahl Zeilen zurück."""
+        if self.engine is None or not self.has_pending(): return 0
+        with self._lock, self._open("ab+") as f:
+            f.seek(0)
+            merged = self._read(f)
+            if merged:
+                try:
+                    self._apply(merged)
+                except OperationalError:
+                    raise   # DB weg -> Journal behalten, später erneut
+                except (StatementError, ValueError):
+                    # einzelne kaputte Zeile darf nicht den ganzen Puffer blockieren
+                    self._apply_each(merged)
+            f.truncate(0)
+            if self.fsync: os.fsync(f.fileno())
+            return len(merged)
+
+    def try_flush(self) -> int:
+        """Wie flush(), aber Fehler nur loggen (Request-Hook, Timer, atexit, Start)."""
+        try: return self.flush()
+        except Exception:
+            # Journal bleibt erhalten -> nächster Versuch beim nächsten Flush
+            log.exception("Autosave flush failed")
+            return 0
+
+    def _apply_each(self, merged):
+        for key, fields in merged.items():
+            try:
+                self._apply({key: fields})
+            except OperationalError:
+                raise
+            except (StatementError, ValueError) as e:
+                log.error("Autosave: %s %s verworfen (%s), siehe %s", key[0], key[1], e, self.dead_letter_path)
+                with open(self.dead_letter_path, "a", encoding="utf-8") as dl:
+                    dl.write(json.dumps({"t": key[0], "id": key[1], "f": fields, "error": str(e)}, ensure_ascii=False) + "\n")
+
+    def _apply(self, merged):
+        # gleiche Spaltenmenge -> ein executemany-UPDATE
+        groups: dict[tuple[str, tuple], list[dict]] = {}
+        for (table, row_id), fields in merged.items():
+            _, allowed = self.tables[table]
+            vals = {k: v for k, v in fields.items() if k in allowed or k == "updated_at"}
+            if "updated_at" in vals: vals["updated_at"] = datetime.fromisoformat(vals["updated_at"])
+            groups.setdefault((table, tuple(sorted(vals))), []).append({"_id": row_id, **{f"v_{k}": v for k, v in vals.items()}})
+        with self.engine.begin() as conn:
+            for (table, cols), rows in groups.items():
+                tbl, _ = self.tables[table]
+                stmt = tbl.update().where(tbl.c.id == bindparam("_id")).values({c: bindparam(f"v_{c}") for c in cols})
+                conn.execute(stmt, rows)
+
+    def start(self, engine):
+        """Engine setzen, Journal-Reste (Absturz) einspielen, periodischen Flush starten."""
+        self.engine = engine
+        self.try_flush()
+        if self.flush_interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="autosave-flush", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.try_flush()